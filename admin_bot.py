@@ -1,33 +1,45 @@
 import asyncio
 import logging
-from typing import List
+import time
+from decimal import Decimal, InvalidOperation
+from functools import partial
+from typing import Any, Dict, List, Tuple
 import os
 from io import BytesIO
 
+try:
+    import uvloop
+except ImportError:  # uvloop не поддерживает Windows
+    uvloop = None
+
 from aiogram import Bot, Dispatcher, types
-from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from aiogram.contrib.fsm_storage.redis import RedisStorage2
 from aiogram.dispatcher import FSMContext
+from aiogram.dispatcher.handler import CancelHandler
+from aiogram.dispatcher.middlewares import BaseMiddleware
 from aiogram.dispatcher.filters.state import State, StatesGroup
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.types import InputFile, ContentType
 
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.future import select
-from sqlalchemy.orm import selectinload
-from sqlalchemy import update, delete
+from sqlalchemy.orm import selectinload, joinedload
+from sqlalchemy import update, delete, func, not_, lambda_stmt
 
 from models import Base, User, MenuItem, Order, OrderItem
-from config import DATABASE_URL, LOG_LEVEL, ADMIN_BOT_TOKEN, ALLOWED_ADMIN_IDS
+from db import engine, AsyncSessionLocal
+from sender import safe_send
+from config import LOG_LEVEL, ADMIN_BOT_TOKEN, ALLOWED_ADMIN_IDS, BOT_TOKEN
+from config import REDIS_HOST, REDIS_PORT, REDIS_DB, INIT_DB
 
 # Инициализация
 logging.basicConfig(level=getattr(logging, LOG_LEVEL))
 admin_bot = Bot(token=ADMIN_BOT_TOKEN)
-storage = MemoryStorage()
+# Состояния FSM хранятся в Redis и переживают перезапуск бота
+storage = RedisStorage2(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, prefix="admin_fsm")
 admin_dp = Dispatcher(admin_bot, storage=storage)
 
-# Асинхронный движок БД
-engine = create_async_engine(DATABASE_URL, echo=False)
-AsyncSessionLocal = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+# Основной бот для уведомлений клиентов (одно соединение на весь процесс)
+client_bot = Bot(token=BOT_TOKEN)
 
 
 # FSM состояния для админ-бота
@@ -47,13 +59,29 @@ class AdminStates(StatesGroup):
     order_details = State()
 
 
-# Проверка прав администратора
-def is_admin(user_id: int) -> bool:
-    return user_id in ALLOWED_ADMIN_IDS
+# Проверка прав администратора: связанный метод frozenset без лишнего вызова функции
+is_admin = ALLOWED_ADMIN_IDS.__contains__
+
+
+class AdminMiddleware(BaseMiddleware):
+    """Отбрасывает апдейты от пользователей без прав до вызова обработчиков"""
+
+    async def on_pre_process_message(self, message: types.Message, data: dict):
+        if not is_admin(message.from_user.id):
+            if message.get_command(pure=True) == 'start':
+                await message.answer("❌ У вас нет прав для использования этого бота.")
+            raise CancelHandler()
+
+    async def on_pre_process_callback_query(self, callback_query: types.CallbackQuery, data: dict):
+        if not is_admin(callback_query.from_user.id):
+            raise CancelHandler()
+
+
+admin_dp.middleware.setup(AdminMiddleware())
 
 
 # Админ клавиатуры
-def get_admin_main_keyboard():
+def _build_admin_main_keyboard():
     keyboard = ReplyKeyboardMarkup(resize_keyboard=True)
     keyboard.add(KeyboardButton("📋 Активные заказы"))
     keyboard.add(KeyboardButton("📊 Все заказы"), KeyboardButton("📈 Статистика"))
@@ -62,7 +90,7 @@ def get_admin_main_keyboard():
     return keyboard
 
 
-def get_menu_management_keyboard():
+def _build_menu_management_keyboard():
     keyboard = InlineKeyboardMarkup()
     keyboard.add(InlineKeyboardButton("➕ Добавить позицию", callback_data="add_menu_item"))
     keyboard.add(InlineKeyboardButton("✏️ Редактировать позицию", callback_data="edit_menu_item"))
@@ -72,6 +100,46 @@ def get_menu_management_keyboard():
     return keyboard
 
 
+def _build_photo_choice_keyboard():
+    keyboard = InlineKeyboardMarkup()
+    keyboard.add(InlineKeyboardButton("📸 Добавить фото", callback_data="add_photo"))
+    keyboard.add(InlineKeyboardButton("✅ Сохранить без фото", callback_data="save_without_photo"))
+    return keyboard
+
+
+def _build_edit_fields_keyboard():
+    keyboard = InlineKeyboardMarkup()
+    keyboard.add(InlineKeyboardButton("📂 Категория", callback_data="edit_field:category"))
+    keyboard.add(InlineKeyboardButton("🍽 Название", callback_data="edit_field:name"))
+    keyboard.add(InlineKeyboardButton("💰 Цена", callback_data="edit_field:price"))
+    keyboard.add(InlineKeyboardButton("📸 Фото", callback_data="edit_field:photo"))
+    keyboard.add(InlineKeyboardButton("🔄 Доступность", callback_data="edit_field:availability"))
+    return keyboard
+
+
+def _build_categories_management_keyboard():
+    keyboard = InlineKeyboardMarkup()
+    keyboard.add(InlineKeyboardButton("➕ Добавить категорию", callback_data="add_category"))
+    keyboard.add(InlineKeyboardButton("🗑 Удалить категорию", callback_data="delete_category"))
+    return keyboard
+
+
+# Статичные клавиатуры собираются один раз при загрузке модуля
+_ADMIN_MAIN_KEYBOARD = _build_admin_main_keyboard()
+_MENU_MANAGEMENT_KEYBOARD = _build_menu_management_keyboard()
+_PHOTO_CHOICE_KEYBOARD = _build_photo_choice_keyboard()
+_EDIT_FIELDS_KEYBOARD = _build_edit_fields_keyboard()
+_CATEGORIES_MANAGEMENT_KEYBOARD = _build_categories_management_keyboard()
+
+
+def get_admin_main_keyboard():
+    return _ADMIN_MAIN_KEYBOARD
+
+
+def get_menu_management_keyboard():
+    return _MENU_MANAGEMENT_KEYBOARD
+
+
 def get_order_action_keyboard(order_id: int):
     keyboard = InlineKeyboardMarkup()
     keyboard.add(InlineKeyboardButton("✅ Готов", callback_data=f"ready:{order_id}"))
@@ -81,92 +149,131 @@ def get_order_action_keyboard(order_id: int):
     return keyboard
 
 
+# Постраничный вывод позиций меню
+MENU_PAGE_SIZE = 20
+
+# Цена хранится в numeric(10,2) (не больше 8 цифр до запятой), а клиентам показывается в целых тенге
+MAX_PRICE = Decimal(10 ** 8)
+
+
+def parse_price(text: str) -> Decimal:
+    """Разбирает цену в целых тенге из сообщения администратора, ValueError для неподходящих значений"""
+    try:
+        price = Decimal(text.strip())
+    except InvalidOperation:
+        raise ValueError(f"Неверный формат цены: {text}")
+
+    if not price.is_finite() or price != price.to_integral_value() or not (0 < price < MAX_PRICE):
+        raise ValueError(f"Цена должна быть целым числом тенге от 1 до {MAX_PRICE - 1}: {text}")
+    return price.quantize(Decimal(1))
+
+
+def get_page_number(callback_data: str) -> int:
+    # "edit_menu_item" -> 0, "edit_page:2" -> 2
+    if ':' in callback_data:
+        return int(callback_data.split(':')[1])
+    return 0
+
+
+def add_pagination_buttons(keyboard: InlineKeyboardMarkup, prefix: str, page: int, has_next: bool):
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton("⬅️ Назад", callback_data=f"{prefix}:{page - 1}"))
+    if has_next:
+        buttons.append(InlineKeyboardButton("➡️ Далее", callback_data=f"{prefix}:{page + 1}"))
+    if buttons:
+        keyboard.row(*buttons)
+
+
+# Кэш списков меню: меню меняется только через админ-бот, поэтому
+# кэш сбрасывается при каждом изменении позиций
+MENU_CACHE_TTL = 30
+_MENU_CACHE: Dict[str, Tuple[float, Any]] = {}
+
+
+async def fetch_menu_rows_cached(key: str, stmt):
+    now = time.monotonic()
+    hit = _MENU_CACHE.get(key)
+    if hit and now - hit[0] < MENU_CACHE_TTL:
+        return hit[1]
+
+    async with AsyncSessionLocal() as session:
+        rows = (await session.execute(stmt)).all()
+
+    _MENU_CACHE[key] = (now, rows)
+    return rows
+
+
+def invalidate_menu_cache():
+    _MENU_CACHE.clear()
+
+
 # Функции работы с БД для админа
+# lambda_stmt кэширует компиляцию SQL и загрузчиков связей между вызовами
+_PENDING_ORDERS_STMT = lambda_stmt(lambda: select(Order).options(
+    selectinload(Order.user),
+    selectinload(Order.order_items).selectinload(OrderItem.menu_item)
+).where(Order.status == 'pending').order_by(Order.pickup_time))
+
+
 async def get_pending_orders():
     async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            select(Order).options(
-                selectinload(Order.user),
-                selectinload(Order.order_items).selectinload(OrderItem.menu_item)
-            ).where(Order.status == 'pending').order_by(Order.pickup_time)
-        )
-        return result.scalars().all()
+        result = await session.scalars(_PENDING_ORDERS_STMT)
+        return result.all()
 
 
 async def get_all_orders(limit: int = 20):
     async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            select(Order).options(
-                selectinload(Order.user),
-                selectinload(Order.order_items).selectinload(OrderItem.menu_item)
-            ).order_by(Order.created_at.desc()).limit(limit)
-        )
-        return result.scalars().all()
+        result = await session.scalars(lambda_stmt(lambda: select(Order).options(
+            selectinload(Order.user),
+            selectinload(Order.order_items).selectinload(OrderItem.menu_item)
+        ).order_by(Order.created_at.desc()).limit(limit)))
+        return result.all()
 
 
 async def get_order_statistics():
-    async with AsyncSessionLocal() as session:
-        # Общее количество заказов
-        total_orders = await session.execute(select(Order))
-        total_count = len(total_orders.scalars().all())
+    # Все показатели считаются одним запросом с условными агрегатами
+    stmt = select(
+        func.count(Order.id.distinct()).label('total'),
+        func.count(Order.id.distinct()).filter(Order.status == 'pending').label('pending'),
+        func.count(Order.id.distinct()).filter(Order.status == 'ready').label('ready'),
+        func.coalesce(func.sum(OrderItem.quantity * MenuItem.price), 0).label('revenue'),
+    ).select_from(Order).outerjoin(OrderItem).outerjoin(MenuItem)
 
-        # Количество активных заказов
-        pending_orders = await session.execute(
-            select(Order).where(Order.status == 'pending')
-        )
-        pending_count = len(pending_orders.scalars().all())
-
-        # Количество готовых заказов
-        ready_orders = await session.execute(
-            select(Order).where(Order.status == 'ready')
-        )
-        ready_count = len(ready_orders.scalars().all())
-
-        # Общая сумма заказов
-        all_orders = await session.execute(
-            select(Order).options(
-                selectinload(Order.order_items).selectinload(OrderItem.menu_item)
-            )
-        )
-        orders = all_orders.scalars().all()
-        total_revenue = 0
-        for order in orders:
-            for item in order.order_items:
-                total_revenue += item.menu_item.price * item.quantity
+    async with AsyncSessionLocal() as session:
+        row = (await session.execute(stmt)).one()
 
-        return {
-            'total_orders': total_count,
-            'pending_orders': pending_count,
-            'ready_orders': ready_count,
-            'total_revenue': total_revenue
-        }
+    return {
+        'total_orders': row.total,
+        'pending_orders': row.pending,
+        'ready_orders': row.ready,
+        'total_revenue': row.revenue
+    }
 
 
 async def format_order_for_admin(order: Order) -> str:
-    message = f"🆔 Заказ #{order.id}\n"
-    message += f"👤 Пользователь: @{order.user.username or 'неизвестно'} (ID: {order.user.telegram_id})\n"
-    message += f"📅 Создан: {order.created_at.strftime('%d.%m.%Y %H:%M')}\n"
-    message += f"🕐 Время получения: {order.pickup_time.strftime('%d.%m.%Y %H:%M')}\n"
-    message += f"📊 Статус: {'⏳ Ожидает' if order.status == 'pending' else '✅ Готов'}\n\n"
-
-    message += "📝 Состав заказа:\n"
+    item_lines = []
     total_price = 0
     for order_item in order.order_items:
         item_total = order_item.menu_item.price * order_item.quantity
         total_price += item_total
-        message += f"• {order_item.menu_item.name} x{order_item.quantity} = {item_total}₸\n"
-
-    message += f"\n💰 Итого: {total_price}₸"
-    return message
+        item_lines.append(f"• {order_item.menu_item.name} x{order_item.quantity} = {int(item_total)}₸\n")
+
+    return (
+        f"🆔 Заказ #{order.id}\n"
+        f"👤 Пользователь: @{order.user.username or 'неизвестно'} (ID: {order.user.telegram_id})\n"
+        f"📅 Создан: {order.created_at.strftime('%d.%m.%Y %H:%M')}\n"
+        f"🕐 Время получения: {order.pickup_time.strftime('%d.%m.%Y %H:%M')}\n"
+        f"📊 Статус: {'⏳ Ожидает' if order.status == 'pending' else '✅ Готов'}\n\n"
+        f"📝 Состав заказа:\n"
+        f"{''.join(item_lines)}"
+        f"\n💰 Итого: {int(total_price)}₸"
+    )
 
 
 # Админ обработчики
 @admin_dp.message_handler(commands=['start'])
 async def admin_start(message: types.Message):
-    if not is_admin(message.from_user.id):
-        await message.answer("❌ У вас нет прав для использования этого бота.")
-        return
-
     await message.answer(
         "👨‍💼 Добро пожаловать в админ-панель кафе!\n\n"
         "Здесь вы можете:\n"
@@ -180,9 +287,6 @@ async def admin_start(message: types.Message):
 
 @admin_dp.message_handler(lambda message: message.text == "📋 Активные заказы")
 async def show_active_orders(message: types.Message):
-    if not is_admin(message.from_user.id):
-        return
-
     orders = await get_pending_orders()
 
     if not orders:
@@ -191,41 +295,42 @@ async def show_active_orders(message: types.Message):
 
     await message.answer(f"📋 Активных заказов: {len(orders)}")
 
+    # Карточки отправляются по очереди, чтобы сохранить порядок по времени получения;
+    # safe_send соблюдает лимиты Telegram на чат и повторяет запрос при RetryAfter
     for order in orders:
         order_text = await format_order_for_admin(order)
         keyboard = get_order_action_keyboard(order.id)
-        await message.answer(order_text, reply_markup=keyboard)
+        try:
+            await safe_send(message.chat.id, partial(message.answer, order_text, reply_markup=keyboard))
+        except Exception as e:
+            logging.error(f"Ошибка отправки заказа #{order.id}: {e}")
 
 
 @admin_dp.message_handler(lambda message: message.text == "📊 Все заказы")
 async def show_all_orders(message: types.Message):
-    if not is_admin(message.from_user.id):
-        return
-
     orders = await get_all_orders()
 
     if not orders:
         await message.answer("📊 Заказов пока нет")
         return
 
-    orders_text = f"📊 Последние {len(orders)} заказов:\n\n"
+    parts = [f"📊 Последние {len(orders)} заказов:\n"]
 
     for order in orders:
         status_emoji = "⏳" if order.status == "pending" else "✅"
         total_price = sum(item.menu_item.price * item.quantity for item in order.order_items)
 
-        orders_text += f"{status_emoji} Заказ #{order.id}\n"
-        orders_text += f"👤 @{order.user.username or 'неизвестно'}\n"
-        orders_text += f"💰 {total_price}₸ | 🕐 {order.pickup_time.strftime('%H:%M')}\n\n"
+        parts.append(
+            f"{status_emoji} Заказ #{order.id}\n"
+            f"👤 @{order.user.username or 'неизвестно'}\n"
+            f"💰 {int(total_price)}₸ | 🕐 {order.pickup_time.strftime('%H:%M')}\n"
+        )
 
-    await message.answer(orders_text)
+    await message.answer("\n".join(parts))
 
 
 @admin_dp.message_handler(lambda message: message.text == "📈 Статистика")
 async def show_statistics(message: types.Message):
-    if not is_admin(message.from_user.id):
-        return
-
     stats = await get_order_statistics()
 
     stats_text = "📈 Статистика кафе:\n\n"
@@ -243,9 +348,6 @@ async def show_statistics(message: types.Message):
 
 @admin_dp.message_handler(lambda message: message.text == "🍽 Управление меню")
 async def manage_menu(message: types.Message):
-    if not is_admin(message.from_user.id):
-        return
-
     keyboard = get_menu_management_keyboard()
     await message.answer(
         "🍽 Управление меню:\n\n"
@@ -254,33 +356,31 @@ async def manage_menu(message: types.Message):
     )
 
 
-@admin_dp.callback_query_handler(lambda c: c.data.startswith('ready:'))
-async def mark_order_ready(callback_query: types.CallbackQuery):
-    if not is_admin(callback_query.from_user.id):
-        return
-
+async def mark_order_ready(callback_query: types.CallbackQuery, state: FSMContext):
     order_id = int(callback_query.data.split(':')[1])
 
     async with AsyncSessionLocal() as session:
+        # Меняем статус и сразу получаем telegram_id пользователя через RETURNING
+        telegram_id = select(User.telegram_id).where(User.id == Order.user_id).scalar_subquery()
         result = await session.execute(
-            select(Order).options(selectinload(Order.user)).where(Order.id == order_id)
+            update(Order)
+            .where(Order.id == order_id)
+            .values(status='ready')
+            .returning(Order.pickup_time, telegram_id.label('telegram_id'))
         )
-        order = result.scalar_one_or_none()
+        order = result.one_or_none()
+        await session.commit()
 
         if order:
-            order.status = 'ready'
-            await session.commit()
 
             # Уведомляем пользователя через основной бот
-            from config import BOT_TOKEN
-            client_bot = Bot(token=BOT_TOKEN)
             try:
-                await client_bot.send_message(
-                    order.user.telegram_id,
-                    f"✅ Ваш заказ №{order.id} готов к выдаче!\n"
+                await safe_send(order.telegram_id, partial(
+                    client_bot.send_message,
+                    order.telegram_id,
+                    f"✅ Ваш заказ №{order_id} готов к выдаче!\n"
                     f"🕐 Время получения: {order.pickup_time.strftime('%H:%M')}"
-                )
-                await client_bot.session.close()
+                ))
             except Exception as e:
                 logging.error(f"Ошибка отправки уведомления пользователю: {e}")
 
@@ -293,18 +393,12 @@ async def mark_order_ready(callback_query: types.CallbackQuery):
 
 @admin_dp.callback_query_handler(lambda c: c.data == "add_menu_item")
 async def start_adding_item(callback_query: types.CallbackQuery):
-    if not is_admin(callback_query.from_user.id):
-        return
-
     await callback_query.message.answer("📝 Введите категорию нового блюда:")
     await AdminStates.adding_item_category.set()
 
 
 @admin_dp.message_handler(state=AdminStates.adding_item_category)
 async def process_item_category(message: types.Message, state: FSMContext):
-    if not is_admin(message.from_user.id):
-        return
-
     await state.update_data(category=message.text)
     await message.answer("📝 Введите название блюда:")
     await AdminStates.adding_item_name.set()
@@ -312,9 +406,6 @@ async def process_item_category(message: types.Message, state: FSMContext):
 
 @admin_dp.message_handler(state=AdminStates.adding_item_name)
 async def process_item_name(message: types.Message, state: FSMContext):
-    if not is_admin(message.from_user.id):
-        return
-
     await state.update_data(name=message.text)
     await message.answer("💰 Введите цену блюда (в тенге):")
     await AdminStates.adding_item_price.set()
@@ -322,49 +413,41 @@ async def process_item_name(message: types.Message, state: FSMContext):
 
 @admin_dp.message_handler(state=AdminStates.adding_item_price)
 async def process_item_price(message: types.Message, state: FSMContext):
-    if not is_admin(message.from_user.id):
-        return
-
     try:
-        price = float(message.text)
-        await state.update_data(price=price)
-
-        keyboard = InlineKeyboardMarkup()
-        keyboard.add(InlineKeyboardButton("📸 Добавить фото", callback_data="add_photo"))
-        keyboard.add(InlineKeyboardButton("✅ Сохранить без фото", callback_data="save_without_photo"))
+        price = parse_price(message.text)
+        # Redis-хранилище сериализует данные в JSON, поэтому цену храним строкой
+        await state.update_data(price=str(price))
 
         await message.answer(
             "Хотите добавить фотографию для этого блюда?",
-            reply_markup=keyboard
+            reply_markup=_PHOTO_CHOICE_KEYBOARD
         )
         await AdminStates.adding_item_photo.set()
 
     except ValueError:
-        await message.answer("❌ Неверный формат цены. Введите число:")
+        await message.answer("❌ Неверный формат цены. Введите целое число тенге:")
 
 
 @admin_dp.callback_query_handler(lambda c: c.data == "save_without_photo", state=AdminStates.adding_item_photo)
 async def save_item_without_photo(callback_query: types.CallbackQuery, state: FSMContext):
-    if not is_admin(callback_query.from_user.id):
-        return
-
     data = await state.get_data()
 
     async with AsyncSessionLocal() as session:
         new_item = MenuItem(
             category=data['category'],
             name=data['name'],
-            price=data['price'],
+            price=Decimal(data['price']),
             is_available=True
         )
         session.add(new_item)
         await session.commit()
+        invalidate_menu_cache()
 
     await callback_query.message.edit_text(
         f"✅ Новое блюдо добавлено:\n"
         f"📂 Категория: {data['category']}\n"
         f"🍽 Название: {data['name']}\n"
-        f"💰 Цена: {data['price']}₸"
+        f"💰 Цена: {int(Decimal(data['price']))}₸"
     )
 
     await state.finish()
@@ -372,9 +455,6 @@ async def save_item_without_photo(callback_query: types.CallbackQuery, state: FS
 
 @admin_dp.message_handler(content_types=ContentType.PHOTO, state=AdminStates.adding_item_photo)
 async def process_photo_handler(message: types.Message, state: FSMContext):
-    if not is_admin(message.from_user.id):
-        return
-
     data = await state.get_data()
     photo_file_id = message.photo[-1].file_id
 
@@ -384,12 +464,12 @@ async def process_photo_handler(message: types.Message, state: FSMContext):
         item_id = data['adding_photo_to_item_id']
 
         async with AsyncSessionLocal() as session:
-            result = await session.execute(select(MenuItem).where(MenuItem.id == item_id))
-            item = result.scalar_one_or_none()
+            item = await session.get(MenuItem, item_id)
 
             if item:
                 item.photo_file_id = photo_file_id
                 await session.commit()
+                invalidate_menu_cache()
                 await message.answer(f"✅ Фото добавлено для '{item.name}'!")
             else:
                 await message.answer("❌ Позиция не найдена")
@@ -399,18 +479,19 @@ async def process_photo_handler(message: types.Message, state: FSMContext):
             new_item = MenuItem(
                 category=data['category'],
                 name=data['name'],
-                price=data['price'],
+                price=Decimal(data['price']),
                 is_available=True,
                 photo_file_id=photo_file_id
             )
             session.add(new_item)
             await session.commit()
+            invalidate_menu_cache()
 
         await message.answer(
             f"✅ Новое блюдо с фото добавлено:\n"
             f"📂 Категория: {data['category']}\n"
             f"🍽 Название: {data['name']}\n"
-            f"💰 Цена: {data['price']}₸"
+            f"💰 Цена: {int(Decimal(data['price']))}₸"
         )
 
     await state.finish()
@@ -418,67 +499,58 @@ async def process_photo_handler(message: types.Message, state: FSMContext):
 
 @admin_dp.callback_query_handler(lambda c: c.data == "add_photo", state=AdminStates.adding_item_photo)
 async def request_photo_for_new_item(callback_query: types.CallbackQuery):
-    if not is_admin(callback_query.from_user.id):
-        return
-
     await callback_query.message.answer("📸 Отправьте фотографию нового блюда:")
     # Состояние уже установлено, просто ждем фото
 
 
 @admin_dp.callback_query_handler(lambda c: c.data == "edit_menu_item")
-async def start_editing_item(callback_query: types.CallbackQuery):
-    if not is_admin(callback_query.from_user.id):
-        return
+async def start_editing_item(callback_query: types.CallbackQuery, state: FSMContext):
+    page = get_page_number(callback_query.data)
 
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(select(MenuItem).where(MenuItem.is_available == True))
-        items = result.scalars().all()
+    items = await fetch_menu_rows_cached(
+        f"edit:{page}",
+        select(MenuItem.id, MenuItem.name, MenuItem.price).where(MenuItem.is_available == True)
+        .order_by(MenuItem.id).limit(MENU_PAGE_SIZE + 1).offset(page * MENU_PAGE_SIZE)
+    )
 
     if not items:
         await callback_query.message.answer("❌ В меню нет позиций для редактирования")
         return
 
     keyboard = InlineKeyboardMarkup()
-    for item in items:
+    for item in items[:MENU_PAGE_SIZE]:
         keyboard.add(InlineKeyboardButton(
-            f"{item.name} - {item.price}₸",
+            f"{item.name} - {int(item.price)}₸",
             callback_data=f"edit_item:{item.id}"
         ))
+    add_pagination_buttons(keyboard, "edit_page", page, len(items) > MENU_PAGE_SIZE)
 
-    await callback_query.message.answer(
-        "✏️ Выберите позицию для редактирования:",
-        reply_markup=keyboard
-    )
+    text = "✏️ Выберите позицию для редактирования:"
+    # Листание страниц редактирует список, новое сообщение отправляется только при входе из меню
+    if callback_query.data.startswith("edit_page:"):
+        await callback_query.message.edit_text(f"{text}\n📄 Страница {page + 1}", reply_markup=keyboard)
+    else:
+        await callback_query.message.answer(text, reply_markup=keyboard)
 
 
-@admin_dp.callback_query_handler(lambda c: c.data.startswith('edit_item:'))
 async def select_edit_field(callback_query: types.CallbackQuery, state: FSMContext):
-    if not is_admin(callback_query.from_user.id):
-        return
-
     item_id = int(callback_query.data.split(':')[1])
     await state.update_data(editing_item_id=item_id)
 
     async with AsyncSessionLocal() as session:
-        result = await session.execute(select(MenuItem).where(MenuItem.id == item_id))
-        item = result.scalar_one_or_none()
+        item = await session.get(MenuItem, item_id)
 
     if not item:
         await callback_query.message.answer("❌ Позиция не найдена")
         return
 
-    keyboard = InlineKeyboardMarkup()
-    keyboard.add(InlineKeyboardButton("📂 Категория", callback_data="edit_field:category"))
-    keyboard.add(InlineKeyboardButton("🍽 Название", callback_data="edit_field:name"))
-    keyboard.add(InlineKeyboardButton("💰 Цена", callback_data="edit_field:price"))
-    keyboard.add(InlineKeyboardButton("📸 Фото", callback_data="edit_field:photo"))
-    keyboard.add(InlineKeyboardButton("🔄 Доступность", callback_data="edit_field:availability"))
+    keyboard = _EDIT_FIELDS_KEYBOARD
 
     await callback_query.message.edit_text(
         f"✏️ Редактирование: {item.name}\n\n"
         f"📂 Категория: {item.category}\n"
         f"🍽 Название: {item.name}\n"
-        f"💰 Цена: {item.price}₸\n"
+        f"💰 Цена: {int(item.price)}₸\n"
         f"📸 Фото: {'Есть' if item.photo_file_id else 'Нет'}\n"
         f"🔄 Доступность: {'Да' if item.is_available else 'Нет'}\n\n"
         "Что хотите изменить?",
@@ -486,11 +558,7 @@ async def select_edit_field(callback_query: types.CallbackQuery, state: FSMConte
     )
 
 
-@admin_dp.callback_query_handler(lambda c: c.data.startswith('edit_field:'))
 async def process_edit_field(callback_query: types.CallbackQuery, state: FSMContext):
-    if not is_admin(callback_query.from_user.id):
-        return
-
     field = callback_query.data.split(':')[1]
     await state.update_data(editing_field=field)
 
@@ -511,13 +579,18 @@ async def process_edit_field(callback_query: types.CallbackQuery, state: FSMCont
         item_id = data['editing_item_id']
 
         async with AsyncSessionLocal() as session:
-            result = await session.execute(select(MenuItem).where(MenuItem.id == item_id))
-            item = result.scalar_one_or_none()
+            # Переключаем доступность одним UPDATE без предварительного SELECT
+            result = await session.execute(
+                update(MenuItem)
+                .where(MenuItem.id == item_id)
+                .values(is_available=not_(MenuItem.is_available))
+                .returning(MenuItem.name, MenuItem.is_available)
+            )
+            item = result.one_or_none()
+            await session.commit()
+            invalidate_menu_cache()
 
             if item:
-                item.is_available = not item.is_available
-                await session.commit()
-
                 status = "доступна" if item.is_available else "недоступна"
                 await callback_query.message.answer(f"✅ Позиция '{item.name}' теперь {status}")
 
@@ -526,16 +599,12 @@ async def process_edit_field(callback_query: types.CallbackQuery, state: FSMCont
 
 @admin_dp.message_handler(state=AdminStates.editing_item_value)
 async def update_item_field(message: types.Message, state: FSMContext):
-    if not is_admin(message.from_user.id):
-        return
-
     data = await state.get_data()
     item_id = data['editing_item_id']
     field = data['editing_field']
 
     async with AsyncSessionLocal() as session:
-        result = await session.execute(select(MenuItem).where(MenuItem.id == item_id))
-        item = result.scalar_one_or_none()
+        item = await session.get(MenuItem, item_id)
 
         if not item:
             await message.answer("❌ Позиция не найдена")
@@ -548,9 +617,10 @@ async def update_item_field(message: types.Message, state: FSMContext):
             elif field == "name":
                 item.name = message.text
             elif field == "price":
-                item.price = float(message.text)
+                item.price = parse_price(message.text)
 
             await session.commit()
+            invalidate_menu_cache()
             await message.answer(f"✅ {field.capitalize()} обновлено успешно!")
 
         except ValueError:
@@ -562,63 +632,59 @@ async def update_item_field(message: types.Message, state: FSMContext):
 
 @admin_dp.message_handler(content_types=ContentType.PHOTO, state=AdminStates.editing_item_value)
 async def update_item_photo(message: types.Message, state: FSMContext):
-    if not is_admin(message.from_user.id):
-        return
-
     data = await state.get_data()
     item_id = data['editing_item_id']
 
     photo_file_id = message.photo[-1].file_id
 
     async with AsyncSessionLocal() as session:
-        result = await session.execute(select(MenuItem).where(MenuItem.id == item_id))
-        item = result.scalar_one_or_none()
+        item = await session.get(MenuItem, item_id)
 
         if item:
             item.photo_file_id = photo_file_id
             await session.commit()
+            invalidate_menu_cache()
             await message.answer(f"✅ Фото для '{item.name}' обновлено!")
 
     await state.finish()
 
 
 @admin_dp.callback_query_handler(lambda c: c.data == "delete_menu_item")
-async def start_deleting_item(callback_query: types.CallbackQuery):
-    if not is_admin(callback_query.from_user.id):
-        return
+async def start_deleting_item(callback_query: types.CallbackQuery, state: FSMContext):
+    page = get_page_number(callback_query.data)
 
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(select(MenuItem))
-        items = result.scalars().all()
+    items = await fetch_menu_rows_cached(
+        f"delete:{page}",
+        select(MenuItem.id, MenuItem.name, MenuItem.price, MenuItem.is_available)
+        .order_by(MenuItem.id).limit(MENU_PAGE_SIZE + 1).offset(page * MENU_PAGE_SIZE)
+    )
 
     if not items:
         await callback_query.message.answer("❌ В меню нет позиций для удаления")
         return
 
     keyboard = InlineKeyboardMarkup()
-    for item in items:
+    for item in items[:MENU_PAGE_SIZE]:
         status = "✅" if item.is_available else "❌"
         keyboard.add(InlineKeyboardButton(
-            f"{status} {item.name} - {item.price}₸",
+            f"{status} {item.name} - {int(item.price)}₸",
             callback_data=f"delete_item:{item.id}"
         ))
+    add_pagination_buttons(keyboard, "delete_page", page, len(items) > MENU_PAGE_SIZE)
 
-    await callback_query.message.answer(
-        "🗑 Выберите позицию для удаления:",
-        reply_markup=keyboard
-    )
+    text = "🗑 Выберите позицию для удаления:"
+    # Листание страниц редактирует список, новое сообщение отправляется только при входе из меню
+    if callback_query.data.startswith("delete_page:"):
+        await callback_query.message.edit_text(f"{text}\n📄 Страница {page + 1}", reply_markup=keyboard)
+    else:
+        await callback_query.message.answer(text, reply_markup=keyboard)
 
 
-@admin_dp.callback_query_handler(lambda c: c.data.startswith('delete_item:'))
-async def confirm_delete_item(callback_query: types.CallbackQuery):
-    if not is_admin(callback_query.from_user.id):
-        return
-
+async def confirm_delete_item(callback_query: types.CallbackQuery, state: FSMContext):
     item_id = int(callback_query.data.split(':')[1])
 
     async with AsyncSessionLocal() as session:
-        result = await session.execute(select(MenuItem).where(MenuItem.id == item_id))
-        item = result.scalar_one_or_none()
+        item = await session.get(MenuItem, item_id)
 
         if not item:
             await callback_query.message.answer("❌ Позиция не найдена")
@@ -632,27 +698,23 @@ async def confirm_delete_item(callback_query: types.CallbackQuery):
             f"⚠️ Вы уверены, что хотите удалить:\n\n"
             f"🍽 {item.name}\n"
             f"📂 {item.category}\n"
-            f"💰 {item.price}₸\n\n"
+            f"💰 {int(item.price)}₸\n\n"
             f"❗ Это действие нельзя отменить!",
             reply_markup=keyboard
         )
 
 
-@admin_dp.callback_query_handler(lambda c: c.data.startswith('confirm_delete:'))
-async def delete_item_confirmed(callback_query: types.CallbackQuery):
-    if not is_admin(callback_query.from_user.id):
-        return
-
+async def delete_item_confirmed(callback_query: types.CallbackQuery, state: FSMContext):
     item_id = int(callback_query.data.split(':')[1])
 
     async with AsyncSessionLocal() as session:
-        result = await session.execute(select(MenuItem).where(MenuItem.id == item_id))
-        item = result.scalar_one_or_none()
+        item = await session.get(MenuItem, item_id)
 
         if item:
             item_name = item.name
             await session.delete(item)
             await session.commit()
+            invalidate_menu_cache()
 
             await callback_query.message.edit_text(
                 f"✅ Позиция '{item_name}' успешно удалена из меню"
@@ -668,84 +730,65 @@ async def cancel_delete(callback_query: types.CallbackQuery):
 
 @admin_dp.callback_query_handler(lambda c: c.data == "manage_categories")
 async def manage_categories(callback_query: types.CallbackQuery):
-    if not is_admin(callback_query.from_user.id):
-        return
-
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(select(MenuItem.category).distinct())
-        categories = result.scalars().all()
-
-        categories_text = "📂 Категории в меню:\n\n"
-        for i, category in enumerate(categories, 1):
-            # Подсчитываем количество позиций в категории
-            count_result = await session.execute(
-                select(MenuItem).where(MenuItem.category == category)
-            )
-            count = len(count_result.scalars().all())
-            categories_text += f"{i}. {category} ({count} позиций)\n"
+    # Подсчитываем количество позиций в каждой категории одним запросом
+    categories_with_counts = await fetch_menu_rows_cached(
+        "categories",
+        select(MenuItem.category, func.count(MenuItem.id))
+        .group_by(MenuItem.category)
+        .order_by(MenuItem.category)
+    )
 
-    keyboard = InlineKeyboardMarkup()
-    keyboard.add(InlineKeyboardButton("➕ Добавить категорию", callback_data="add_category"))
-    keyboard.add(InlineKeyboardButton("🗑 Удалить категорию", callback_data="delete_category"))
+    categories_text = "📂 Категории в меню:\n\n"
+    for i, (category, count) in enumerate(categories_with_counts, 1):
+        categories_text += f"{i}. {category} ({count} позиций)\n"
 
-    await callback_query.message.answer(categories_text, reply_markup=keyboard)
+    await callback_query.message.answer(categories_text, reply_markup=_CATEGORIES_MANAGEMENT_KEYBOARD)
 
 
 @admin_dp.callback_query_handler(lambda c: c.data == "add_photos")
 async def add_photos_menu(callback_query: types.CallbackQuery):
-    if not is_admin(callback_query.from_user.id):
-        return
-
-    async with AsyncSessionLocal() as session:
-        # Получаем все позиции без фото
-        result = await session.execute(
-            select(MenuItem).where(MenuItem.photo_file_id.is_(None))
-        )
-        items_without_photos = result.scalars().all()
+    # Считаем позиции без фото по категориям
+    categories_with_counts = await fetch_menu_rows_cached(
+        "photo_categories",
+        select(MenuItem.category, func.count(MenuItem.id))
+        .where(MenuItem.photo_file_id.is_(None))
+        .group_by(MenuItem.category)
+        .order_by(MenuItem.category)
+    )
 
-    if not items_without_photos:
+    if not categories_with_counts:
         await callback_query.message.answer("✅ У всех позиций уже есть фотографии!")
         return
 
-    # Группируем по категориям
-    categories_with_items = {}
-    for item in items_without_photos:
-        if item.category not in categories_with_items:
-            categories_with_items[item.category] = []
-        categories_with_items[item.category].append(item)
-
     # Создаем клавиатуру с категориями
     keyboard = InlineKeyboardMarkup()
-    for category, items in categories_with_items.items():
+    for category, count in categories_with_counts:
         keyboard.add(InlineKeyboardButton(
-            f"📂 {category} ({len(items)} позиций)",
+            f"📂 {category} ({count} позиций)",
             callback_data=f"photo_category:{category}"
         ))
 
     keyboard.add(InlineKeyboardButton("📸 Показать все позиции", callback_data="photo_all_items"))
 
+    total_without_photos = sum(count for _, count in categories_with_counts)
     await callback_query.message.answer(
-        f"📸 Позиций без фотографий: {len(items_without_photos)}\n\n"
+        f"📸 Позиций без фотографий: {total_without_photos}\n\n"
         "Выберите категорию:",
         reply_markup=keyboard
     )
 
 
-@admin_dp.callback_query_handler(lambda c: c.data.startswith('photo_category:'))
-async def show_items_by_category_for_photo(callback_query: types.CallbackQuery):
-    if not is_admin(callback_query.from_user.id):
-        return
-
+async def show_items_by_category_for_photo(callback_query: types.CallbackQuery, state: FSMContext):
     category = callback_query.data.split(':', 1)[1]
 
     async with AsyncSessionLocal() as session:
         result = await session.execute(
-            select(MenuItem).where(
+            select(MenuItem.id, MenuItem.name, MenuItem.price).where(
                 MenuItem.photo_file_id.is_(None),
                 MenuItem.category == category
             )
         )
-        items_without_photos = result.scalars().all()
+        items_without_photos = result.all()
 
     if not items_without_photos:
         await callback_query.message.edit_text("✅ В этой категории у всех позиций уже есть фотографии!")
@@ -754,7 +797,7 @@ async def show_items_by_category_for_photo(callback_query: types.CallbackQuery):
     keyboard = InlineKeyboardMarkup()
     for item in items_without_photos:
         keyboard.add(InlineKeyboardButton(
-            f"📸 {item.name} - {item.price}₸",
+            f"📸 {item.name} - {int(item.price)}₸",
             callback_data=f"add_photo_to:{item.id}"
         ))
 
@@ -769,46 +812,43 @@ async def show_items_by_category_for_photo(callback_query: types.CallbackQuery):
 
 
 @admin_dp.callback_query_handler(lambda c: c.data == "photo_all_items")
-async def show_all_items_for_photo(callback_query: types.CallbackQuery):
-    if not is_admin(callback_query.from_user.id):
-        return
+async def show_all_items_for_photo(callback_query: types.CallbackQuery, state: FSMContext):
+    page = get_page_number(callback_query.data)
 
     async with AsyncSessionLocal() as session:
         result = await session.execute(
-            select(MenuItem).where(MenuItem.photo_file_id.is_(None))
+            select(MenuItem.id, MenuItem.name, MenuItem.category, MenuItem.price)
+            .where(MenuItem.photo_file_id.is_(None))
+            .order_by(MenuItem.id).limit(MENU_PAGE_SIZE + 1).offset(page * MENU_PAGE_SIZE)
         )
-        items_without_photos = result.scalars().all()
+        items_without_photos = result.all()
 
     if not items_without_photos:
         await callback_query.message.edit_text("✅ У всех позиций уже есть фотографии!")
         return
 
     keyboard = InlineKeyboardMarkup()
-    for item in items_without_photos:
+    for item in items_without_photos[:MENU_PAGE_SIZE]:
         keyboard.add(InlineKeyboardButton(
-            f"📸 {item.name} ({item.category}) - {item.price}₸",
+            f"📸 {item.name} ({item.category}) - {int(item.price)}₸",
             callback_data=f"add_photo_to:{item.id}"
         ))
+    add_pagination_buttons(keyboard, "photo_page", page, len(items_without_photos) > MENU_PAGE_SIZE)
 
     keyboard.add(InlineKeyboardButton("⬅️ Назад к категориям", callback_data="add_photos"))
 
     await callback_query.message.edit_text(
-        f"📸 Все позиции без фотографий ({len(items_without_photos)}):\n"
+        f"📸 Все позиции без фотографий (страница {page + 1}):\n"
         "Выберите позицию для добавления фото:",
         reply_markup=keyboard
     )
 
 
-@admin_dp.callback_query_handler(lambda c: c.data.startswith('add_photo_to:'))
 async def start_adding_photo(callback_query: types.CallbackQuery, state: FSMContext):
-    if not is_admin(callback_query.from_user.id):
-        return
-
     item_id = int(callback_query.data.split(':')[1])
 
     async with AsyncSessionLocal() as session:
-        result = await session.execute(select(MenuItem).where(MenuItem.id == item_id))
-        item = result.scalar_one_or_none()
+        item = await session.get(MenuItem, item_id)
 
     if not item:
         await callback_query.message.answer("❌ Позиция не найдена")
@@ -819,11 +859,7 @@ async def start_adding_photo(callback_query: types.CallbackQuery, state: FSMCont
     await AdminStates.adding_item_photo.set()
 
 
-@admin_dp.callback_query_handler(lambda c: c.data.startswith('cancel:'))
-async def cancel_order(callback_query: types.CallbackQuery):
-    if not is_admin(callback_query.from_user.id):
-        return
-
+async def cancel_order(callback_query: types.CallbackQuery, state: FSMContext):
     order_id = int(callback_query.data.split(':')[1])
 
     keyboard = InlineKeyboardMarkup()
@@ -837,16 +873,12 @@ async def cancel_order(callback_query: types.CallbackQuery):
     )
 
 
-@admin_dp.callback_query_handler(lambda c: c.data.startswith('confirm_cancel:'))
-async def confirm_cancel_order(callback_query: types.CallbackQuery):
-    if not is_admin(callback_query.from_user.id):
-        return
-
+async def confirm_cancel_order(callback_query: types.CallbackQuery, state: FSMContext):
     order_id = int(callback_query.data.split(':')[1])
 
     async with AsyncSessionLocal() as session:
         result = await session.execute(
-            select(Order).options(selectinload(Order.user)).where(Order.id == order_id)
+            select(Order).options(joinedload(Order.user)).where(Order.id == order_id)
         )
         order = result.scalar_one_or_none()
 
@@ -855,13 +887,13 @@ async def confirm_cancel_order(callback_query: types.CallbackQuery):
             await session.commit()
 
             # Уведомляем пользователя
-            from main import bot
             try:
-                await bot.send_message(
+                await safe_send(order.user.telegram_id, partial(
+                    client_bot.send_message,
                     order.user.telegram_id,
                     f"❌ Ваш заказ №{order.id} был отменен администратором.\n"
                     f"Если у вас есть вопросы, обратитесь к администрации кафе."
-                )
+                ))
             except Exception as e:
                 logging.error(f"Ошибка отправки уведомления об отмене: {e}")
 
@@ -880,9 +912,6 @@ async def cancel_action(callback_query: types.CallbackQuery):
 # Обработчик для добавления фото к существующим позициям
 @admin_dp.message_handler(content_types=ContentType.PHOTO, state=AdminStates.adding_item_photo)
 async def process_photo_handler(message: types.Message, state: FSMContext):
-    if not is_admin(message.from_user.id):
-        return
-
     data = await state.get_data()
     photo_file_id = message.photo[-1].file_id
 
@@ -892,12 +921,12 @@ async def process_photo_handler(message: types.Message, state: FSMContext):
         item_id = data['adding_photo_to_item_id']
 
         async with AsyncSessionLocal() as session:
-            result = await session.execute(select(MenuItem).where(MenuItem.id == item_id))
-            item = result.scalar_one_or_none()
+            item = await session.get(MenuItem, item_id)
 
             if item:
                 item.photo_file_id = photo_file_id
                 await session.commit()
+                invalidate_menu_cache()
                 await message.answer(f"✅ Фото добавлено для '{item.name}'!")
             else:
                 await message.answer("❌ Позиция не найдена")
@@ -907,34 +936,69 @@ async def process_photo_handler(message: types.Message, state: FSMContext):
             new_item = MenuItem(
                 category=data['category'],
                 name=data['name'],
-                price=data['price'],
+                price=Decimal(data['price']),
                 is_available=True,
                 photo_file_id=photo_file_id
             )
             session.add(new_item)
             await session.commit()
+            invalidate_menu_cache()
 
         await message.answer(
             f"✅ Новое блюдо с фото добавлено:\n"
             f"📂 Категория: {data['category']}\n"
             f"🍽 Название: {data['name']}\n"
-            f"💰 Цена: {data['price']}₸"
+            f"💰 Цена: {int(Decimal(data['price']))}₸"
         )
 
     await state.finish()
 
 
+# Все callback-и вида "префикс:значение" проходят через один обработчик:
+# одно совпадение регулярного выражения вместо проверки каждого фильтра по очереди
+CALLBACK_ROUTES = {
+    'ready': mark_order_ready,
+    'cancel': cancel_order,
+    'confirm_cancel': confirm_cancel_order,
+    'edit_page': start_editing_item,
+    'edit_item': select_edit_field,
+    'edit_field': process_edit_field,
+    'delete_page': start_deleting_item,
+    'delete_item': confirm_delete_item,
+    'confirm_delete': delete_item_confirmed,
+    'photo_category': show_items_by_category_for_photo,
+    'photo_page': show_all_items_for_photo,
+    'add_photo_to': start_adding_photo,
+}
+
+
+@admin_dp.callback_query_handler(regexp=rf"^({'|'.join(CALLBACK_ROUTES)}):")
+async def route_callback(callback_query: types.CallbackQuery, state: FSMContext, regexp):
+    await CALLBACK_ROUTES[regexp.group(1)](callback_query, state)
+
+
 async def main():
-    # Создаем таблицы при запуске
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    # Схема создается migrate_db.py; при запуске таблицы создаются только по флагу INIT_DB
+    if INIT_DB:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
 
     print("🔧 Админ-бот запущен!")
-    print(f"👨‍💼 Разрешенные администраторы: {ALLOWED_ADMIN_IDS}")
-    await admin_dp.start_polling()
+    print(f"👨‍💼 Разрешенные администраторы: {', '.join(map(str, sorted(ALLOWED_ADMIN_IDS)))}")
+    try:
+        await admin_dp.start_polling()
+    finally:
+        # Закрываем соединение бота уведомлений и хранилище состояний
+        if client_bot.session:
+            await client_bot.session.close()
+        await admin_dp.storage.close()
+        await admin_dp.storage.wait_closed()
 
 
 if __name__ == '__main__':
+    if uvloop is not None:
+        uvloop.install()
+
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
@@ -0,0 +1,18 @@
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+
+from config import DATABASE_URL
+
+# Асинхронный движок БД, общий для ботов и скриптов
+engine = create_async_engine(
+    DATABASE_URL,
+    echo=False,
+    pool_size=10,
+    max_overflow=20,
+    pool_timeout=30,
+    pool_pre_ping=True,  # Проверяем соединение перед выдачей из пула
+    pool_recycle=1800,  # Переоткрываем соединения старше 30 минут
+    # JIT PostgreSQL только замедляет короткие запросы.
+    # При работе через pgbouncer добавьте сюда "statement_cache_size": 0
+    connect_args={"server_settings": {"jit": "off"}},
+)
+AsyncSessionLocal = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
@@ -1,31 +1,55 @@
 import asyncio
 import logging
+import re
+import time
+from functools import partial
 from datetime import datetime, timedelta
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
+
+try:
+    import uvloop
+except ImportError:  # uvloop не поддерживает Windows
+    uvloop = None
 
 from aiogram import Bot, Dispatcher, types
-from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from aiogram.contrib.fsm_storage.redis import RedisStorage2
 from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters.state import State, StatesGroup
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.types import InputMediaPhoto
 from aiogram.utils import executor
+from aiogram.utils.exceptions import BadRequest, MessageNotModified
 
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.future import select
-from sqlalchemy.orm import selectinload
+from sqlalchemy import insert, bindparam, lambda_stmt, func
+from sqlalchemy.orm import selectinload, joinedload
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
 from models import Base, User, MenuItem, Order, OrderItem
-from config import BOT_TOKEN, DATABASE_URL, ADMIN_CHAT_ID, LOG_LEVEL
+from db import engine, AsyncSessionLocal
+from sender import safe_send
+from config import BOT_TOKEN, ADMIN_BOT_TOKEN, ADMIN_CHAT_ID, ALLOWED_ADMIN_IDS, LOG_LEVEL, INIT_DB
+from config import REDIS_HOST, REDIS_PORT, REDIS_DB, FSM_TTL
+from config import WEBHOOK_URL, WEBHOOK_PATH, WEBAPP_HOST, WEBAPP_PORT
 
 # Инициализация
 logging.basicConfig(level=getattr(logging, LOG_LEVEL))
 bot = Bot(token=BOT_TOKEN)
-storage = MemoryStorage()
+# Корзины и состояния пользователей хранятся в Redis: переживают перезапуск,
+# доступны нескольким экземплярам бота и удаляются по истечении FSM_TTL
+storage = RedisStorage2(
+    host=REDIS_HOST,
+    port=REDIS_PORT,
+    db=REDIS_DB,
+    prefix="cafe_fsm",
+    state_ttl=FSM_TTL,
+    data_ttl=FSM_TTL,
+    bucket_ttl=FSM_TTL,
+)
 dp = Dispatcher(bot, storage=storage)
 
-# Асинхронный движок БД
-engine = create_async_engine(DATABASE_URL, echo=False)
-AsyncSessionLocal = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+# Админ-бот для уведомлений о новых заказах (одно соединение на весь процесс)
+admin_notification_bot = Bot(token=ADMIN_BOT_TOKEN)
 
 
 # FSM состояния
@@ -38,52 +62,168 @@ class OrderStates(StatesGroup):
 
 
 # Клавиатуры
-def get_main_keyboard():
+def _build_main_keyboard():
     keyboard = ReplyKeyboardMarkup(resize_keyboard=True)
     keyboard.add(KeyboardButton("🍽 Меню"))
     keyboard.add(KeyboardButton("🛒 Мой заказ"), KeyboardButton("👤 Мои заказы"))
     return keyboard
 
 
+def _build_cart_keyboard():
+    keyboard = InlineKeyboardMarkup()
+    keyboard.add(InlineKeyboardButton("✅ Оформить заказ", callback_data="checkout"))
+    keyboard.add(InlineKeyboardButton("🗑 Очистить корзину", callback_data="clear_cart"))
+    keyboard.add(InlineKeyboardButton("🍽 Продолжить покупки", callback_data="continue_shopping"))
+    return keyboard
+
+
+def _build_item_added_keyboard():
+    keyboard = InlineKeyboardMarkup()
+    keyboard.add(InlineKeyboardButton("🛒 Перейти в корзину", callback_data="show_cart"))
+    keyboard.add(InlineKeyboardButton("🍽 Продолжить покупки", callback_data="continue_shopping"))
+    return keyboard
+
+
+def _build_confirm_order_keyboard():
+    keyboard = InlineKeyboardMarkup()
+    keyboard.add(InlineKeyboardButton("✅ Подтвердить", callback_data="confirm_order"))
+    keyboard.add(InlineKeyboardButton("❌ Отменить", callback_data="cancel_order"))
+    return keyboard
+
+
+def _build_back_to_menu_keyboard(text: str):
+    keyboard = InlineKeyboardMarkup()
+    keyboard.add(InlineKeyboardButton(text, callback_data="continue_shopping"))
+    return keyboard
+
+
+# Статичные клавиатуры собираются один раз при загрузке модуля
+_MAIN_KEYBOARD = _build_main_keyboard()
+_CART_KEYBOARD = _build_cart_keyboard()
+_ITEM_ADDED_KEYBOARD = _build_item_added_keyboard()
+_CONFIRM_ORDER_KEYBOARD = _build_confirm_order_keyboard()
+_CART_CLEARED_KEYBOARD = _build_back_to_menu_keyboard("🍽 Перейти к меню")
+_ORDER_CANCELLED_KEYBOARD = _build_back_to_menu_keyboard("🍽 Вернуться к меню")
+
+
+def get_main_keyboard():
+    return _MAIN_KEYBOARD
+
+
+# Кэш клавиатур меню. Меню редактируется из админ-бота (отдельный процесс), сбросить
+# этот кэш оттуда нельзя, поэтому изменения меню видны клиентам не позже чем через TTL
+MENU_CACHE_TTL = 60
+_categories_cache: Optional[Tuple[float, InlineKeyboardMarkup]] = None
+_menu_items_cache: Dict[str, Tuple[float, InlineKeyboardMarkup, Optional[str]]] = {}
+
+
 async def get_categories_keyboard():
+    global _categories_cache
+    now = time.monotonic()
+    if _categories_cache and now - _categories_cache[0] < MENU_CACHE_TTL:
+        return _categories_cache[1]
+
     async with AsyncSessionLocal() as session:
-        result = await session.execute(
+        result = await session.scalars(
             select(MenuItem.category).distinct().where(MenuItem.is_available == True)
         )
-        categories = result.scalars().all()
+        categories = result.all()
 
     keyboard = InlineKeyboardMarkup()
     for category in categories:
         keyboard.add(InlineKeyboardButton(category, callback_data=f"category:{category}"))
+
+    _categories_cache = (now, keyboard)
     return keyboard
 
 
+def _prune_menu_items_cache(now: float):
+    expired = [category for category, hit in _menu_items_cache.items() if now - hit[0] >= MENU_CACHE_TTL]
+    for category in expired:
+        del _menu_items_cache[category]
+
+
 async def get_menu_items_keyboard(category: str):
+    now = time.monotonic()
+    hit = _menu_items_cache.get(category)
+    if hit and now - hit[0] < MENU_CACHE_TTL:
+        return hit[1], hit[2]
+
     async with AsyncSessionLocal() as session:
-        result = await session.execute(
+        result = await session.scalars(
             select(MenuItem).where(
                 MenuItem.category == category,
                 MenuItem.is_available == True
             )
         )
-        items = result.scalars().all()
+        items = result.all()
 
     keyboard = InlineKeyboardMarkup()
     for item in items:
         keyboard.add(InlineKeyboardButton(
-            f"{item.name} - {item.price}₸",
+            f"{item.name} - {int(item.price)}₸",
             callback_data=f"add:{item.id}"
         ))
     keyboard.add(InlineKeyboardButton("⬅️ Назад к категориям", callback_data="back_to_categories"))
-    return keyboard, items  # Возвращаем также список items для отображения фотографий
+
+    # Фото первого блюда категории выбирается один раз и кэшируется вместе с клавиатурой
+    photo_file_id = next((item.photo_file_id for item in items if item.photo_file_id), None)
+
+    # Категория приходит из callback_data, которую клиент может подделать,
+    # поэтому пустые результаты не кэшируются, а устаревшие записи удаляются
+    if items:
+        _prune_menu_items_cache(now)
+        _menu_items_cache[category] = (now, keyboard, photo_file_id)
+    return keyboard, photo_file_id
 
 
 def get_cart_keyboard():
-    keyboard = InlineKeyboardMarkup()
-    keyboard.add(InlineKeyboardButton("✅ Оформить заказ", callback_data="checkout"))
-    keyboard.add(InlineKeyboardButton("🗑 Очистить корзину", callback_data="clear_cart"))
-    keyboard.add(InlineKeyboardButton("🍽 Продолжить покупки", callback_data="continue_shopping"))
-    return keyboard
+    return _CART_KEYBOARD
+
+
+# Редактирование сообщений
+async def safe_edit(callback_query: types.CallbackQuery, text: str, reply_markup=None):
+    """Редактирует сообщение, а если это невозможно - отправляет новое"""
+    try:
+        await callback_query.message.edit_text(text, reply_markup=reply_markup)
+    except BadRequest as e:
+        # Сообщение с фото, слишком старое, удаленное и т.п.: пользователь все равно должен получить ответ
+        logging.error(f"Ошибка редактирования сообщения: {e}")
+        await callback_query.message.answer(text, reply_markup=reply_markup)
+
+
+async def show_photo(callback_query: types.CallbackQuery, photo_file_id: str, caption: str, reply_markup=None):
+    """Показывает фото с подписью, по возможности заменяя медиа текущего сообщения"""
+    # editMessageMedia работает только для сообщений с медиа, текстовое сообщение приходится заменять
+    if callback_query.message.photo:
+        try:
+            await callback_query.message.edit_media(
+                InputMediaPhoto(photo_file_id, caption=caption),
+                reply_markup=reply_markup
+            )
+            return
+        except MessageNotModified:
+            # Сообщение уже показывает это фото с той же подписью
+            return
+        except BadRequest as e:
+            # Медиа заменить не удалось (сообщение не редактируется, неверный file_id и т.п.) - отправляем заново
+            logging.error(f"Ошибка замены фото: {e}")
+
+    try:
+        await callback_query.message.delete()
+        await bot.send_photo(
+            callback_query.from_user.id,
+            photo_file_id,
+            caption=caption,
+            reply_markup=reply_markup
+        )
+    except Exception as e:
+        logging.error(f"Ошибка отправки фото: {e}")
+        # Если фото не загружается или сообщение уже удалено, отправляем новое текстовое сообщение
+        try:
+            await bot.send_message(callback_query.from_user.id, caption, reply_markup=reply_markup)
+        except Exception as e2:
+            logging.error(f"Ошибка отправки сообщения: {e2}")
 
 
 # Функции работы с БД
@@ -92,27 +232,43 @@ async def create_tables():
         await conn.run_sync(Base.metadata.create_all)
 
 
+# Самые частые запросы: SQL компилируется один раз и переиспользуется,
+# а asyncpg кэширует подготовленный statement на соединении
+_MENU_ITEM_BY_ID_STMT = lambda_stmt(
+    lambda: select(MenuItem).where(MenuItem.id == bindparam("item_id"))
+)
+
+# Создание пользователя и обновление его username одним запросом без гонки между SELECT и INSERT
+_upsert_user = pg_insert(User).values(telegram_id=bindparam("telegram_id"), username=bindparam("username"))
+_UPSERT_USER_STMT = _upsert_user.on_conflict_do_update(
+    index_elements=[User.telegram_id],
+    set_={"username": _upsert_user.excluded.username}
+).returning(User.id, User.telegram_id, User.username)
+
+
 async def get_or_create_user(telegram_id: int, username: str = None):
     async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            select(User).where(User.telegram_id == telegram_id)
-        )
-        user = result.scalar_one_or_none()
-
-        if not user:
-            user = User(telegram_id=telegram_id, username=username)
-            session.add(user)
-            await session.commit()
-            await session.refresh(user)
+        result = await session.execute(_UPSERT_USER_STMT, {"telegram_id": telegram_id, "username": username})
+        user = result.one()
+        await session.commit()
 
         return user
 
 
+async def get_db_user_id(state: FSMContext, tg_user: types.User) -> int:
+    """Возвращает id пользователя в БД из FSM-данных, при отсутствии - из базы"""
+    data = await state.get_data()
+    user_id = data.get('db_user_id')
+    if user_id is None:
+        user = await get_or_create_user(telegram_id=tg_user.id, username=tg_user.username)
+        user_id = user.id
+        await state.update_data(db_user_id=user_id)
+    return user_id
+
+
 async def get_menu_item(item_id: int):
     async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            select(MenuItem).where(MenuItem.id == item_id)
-        )
+        result = await session.execute(_MENU_ITEM_BY_ID_STMT, {"item_id": item_id})
         return result.scalar_one_or_none()
 
 
@@ -127,20 +283,27 @@ async def save_order(user_id: int, cart: Dict[str, int], pickup_time: datetime):
         session.add(order)
         await session.flush()  # Получаем ID заказа
 
-        # Добавляем позиции заказа
-        for item_id, quantity in cart.items():
-            order_item = OrderItem(
-                order_id=order.id,
-                menu_item_id=int(item_id),
-                quantity=quantity
-            )
-            session.add(order_item)
+        # Добавляем позиции заказа одним INSERT (с пустым списком SQLAlchemy выполнил бы INSERT без значений)
+        if cart:
+            await session.execute(insert(OrderItem), [
+                {"order_id": order.id, "menu_item_id": int(item_id), "quantity": quantity}
+                for item_id, quantity in cart.items()
+            ])
 
         await session.commit()
         await session.refresh(order)
         return order
 
 
+async def fetch_menu_items(item_ids: List[int]):
+    # Одним запросом получаем id, название и цену всех нужных позиций
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(MenuItem.id, MenuItem.name, MenuItem.price).where(MenuItem.id.in_(item_ids))
+        )
+        return {row.id: row for row in result.all()}
+
+
 async def format_cart_message(cart: Dict[str, int]):
     if not cart:
         return "🛒 Ваша корзина пуста"
@@ -148,31 +311,24 @@ async def format_cart_message(cart: Dict[str, int]):
     total_price = 0
     cart_text = "🛒 Ваша корзина:\n\n"
 
-    async with AsyncSessionLocal() as session:
-        for item_id, quantity in cart.items():
-            result = await session.execute(
-                select(MenuItem).where(MenuItem.id == int(item_id))
-            )
-            item = result.scalar_one_or_none()
-            if item:
-                item_total = item.price * quantity
-                total_price += item_total
-                cart_text += f"• {item.name} x{quantity} = {item_total}₸\n"
+    items_by_id = await fetch_menu_items([int(item_id) for item_id in cart])
+    for item_id, quantity in cart.items():
+        item = items_by_id.get(int(item_id))
+        if item:
+            item_total = item.price * quantity
+            total_price += item_total
+            cart_text += f"• {item.name} x{quantity} = {int(item_total)}₸\n"
 
-    cart_text += f"\n💰 Итого: {total_price}₸"
+    cart_text += f"\n💰 Итого: {int(total_price)}₸"
     return cart_text
 
 
 async def notify_admin_about_order(order_id: int):
-    # Создаем отдельный экземпляр админ-бота для отправки уведомлений
-    from config import ADMIN_BOT_TOKEN, ALLOWED_ADMIN_IDS
-    admin_notification_bot = Bot(token=ADMIN_BOT_TOKEN)
-
     async with AsyncSessionLocal() as session:
         result = await session.execute(
             select(Order).options(
-                selectinload(Order.user),
-                selectinload(Order.order_items).selectinload(OrderItem.menu_item)
+                joinedload(Order.user),
+                selectinload(Order.order_items).joinedload(OrderItem.menu_item)
             ).where(Order.id == order_id)
         )
         order = result.scalar_one_or_none()
@@ -189,9 +345,9 @@ async def notify_admin_about_order(order_id: int):
         for order_item in order.order_items:
             item_total = order_item.menu_item.price * order_item.quantity
             total_price += item_total
-            message += f"• {order_item.menu_item.name} x{order_item.quantity} = {item_total}₸\n"
+            message += f"• {order_item.menu_item.name} x{order_item.quantity} = {int(item_total)}₸\n"
 
-        message += f"\n💰 Итого: {total_price}₸"
+        message += f"\n💰 Итого: {int(total_price)}₸"
 
         keyboard = InlineKeyboardMarkup()
         keyboard.add(InlineKeyboardButton(
@@ -199,24 +355,43 @@ async def notify_admin_about_order(order_id: int):
             callback_data=f"ready:{order.id}"
         ))
 
-        # Отправляем уведомление всем администраторам
-        for admin_id in ALLOWED_ADMIN_IDS:
-            try:
-                await admin_notification_bot.send_message(admin_id, message, reply_markup=keyboard)
-            except Exception as e:
-                logging.error(f"Ошибка отправки уведомления админу {admin_id}: {e}")
+    # Отправляем уведомление всем администраторам параллельно, уже вернув соединение в пул:
+    # ожидание лимитов Telegram не должно удерживать соединение с БД
+    admin_ids = list(ALLOWED_ADMIN_IDS)
+    results = await asyncio.gather(
+        *(safe_send(admin_id, partial(admin_notification_bot.send_message, admin_id, message,
+                                      reply_markup=keyboard))
+          for admin_id in admin_ids),
+        return_exceptions=True
+    )
+    for admin_id, result in zip(admin_ids, results):
+        if isinstance(result, Exception):
+            logging.error(f"Ошибка отправки уведомления админу {admin_id}: {result}")
 
-        # Закрываем соединение
-        await admin_notification_bot.session.close()
+
+# Время получения заказа в формате ЧЧ:ММ
+_TIME_RE = re.compile(r"^([01]?\d|2[0-3]):([0-5]\d)$")
+
+# Ссылки на фоновые задачи, чтобы их не собрал сборщик мусора до завершения
+_background_tasks = set()
+
+
+def _on_background_task_done(task: asyncio.Task):
+    _background_tasks.discard(task)
+    # Исключение фоновой задачи иначе всплыло бы только при сборке мусора
+    if not task.cancelled() and task.exception() is not None:
+        logging.error(f"Ошибка фоновой задачи {task.get_name()}", exc_info=task.exception())
 
 
 # Обработчики
 @dp.message_handler(commands=['start'])
-async def cmd_start(message: types.Message):
+async def cmd_start(message: types.Message, state: FSMContext):
     user = await get_or_create_user(
         telegram_id=message.from_user.id,
         username=message.from_user.username
     )
+    # Запоминаем id пользователя в БД, чтобы не искать его при оформлении заказа
+    await state.update_data(db_user_id=user.id)
 
     await message.answer(
         f"Добро пожаловать в систему предзаказа еды! 🍽\n\n"
@@ -235,47 +410,14 @@ async def show_menu(message: types.Message, state: FSMContext):
 @dp.callback_query_handler(lambda c: c.data.startswith('category:'), state=OrderStates.choosing_category)
 async def process_category_selection(callback_query: types.CallbackQuery, state: FSMContext):
     category = callback_query.data.split(':')[1]
-    keyboard, items = await get_menu_items_keyboard(category)
-
-    # Если есть блюда с фотографиями, показываем их
-    items_with_photos = [item for item in items if item.photo_file_id]
+    keyboard, photo_file_id = await get_menu_items_keyboard(category)
+    text = f"Категория: {category}\nВыберите блюдо:"
 
-    if items_with_photos:
-        # Показываем первое блюдо с фото
-        first_item = items_with_photos[0]
-        try:
-            await callback_query.message.delete()
-            await bot.send_photo(
-                callback_query.from_user.id,
-                first_item.photo_file_id,
-                caption=f"Категория: {category}\nВыберите блюдо:",
-                reply_markup=keyboard
-            )
-        except Exception as e:
-            logging.error(f"Ошибка отправки фото: {e}")
-            # Если фото не загружается или сообщение уже удалено, отправляем новое текстовое сообщение
-            try:
-                await bot.send_message(
-                    callback_query.from_user.id,
-                    f"Категория: {category}\nВыберите блюдо:",
-                    reply_markup=keyboard
-                )
-            except Exception as e2:
-                logging.error(f"Ошибка отправки сообщения: {e2}")
+    # Если есть блюда с фотографиями, показываем фото первого из них
+    if photo_file_id:
+        await show_photo(callback_query, photo_file_id, text, reply_markup=keyboard)
     else:
-        try:
-            await callback_query.message.edit_text(
-                f"Категория: {category}\nВыберите блюдо:",
-                reply_markup=keyboard
-            )
-        except Exception as e:
-            logging.error(f"Ошибка редактирования сообщения: {e}")
-            # Если сообщение нельзя отредактировать, отправляем новое
-            await bot.send_message(
-                callback_query.from_user.id,
-                f"Категория: {category}\nВыберите блюдо:",
-                reply_markup=keyboard
-            )
+        await safe_edit(callback_query, text, reply_markup=keyboard)
 
     await OrderStates.choosing_item.set()
     await callback_query.answer()
@@ -284,16 +426,7 @@ async def process_category_selection(callback_query: types.CallbackQuery, state:
 @dp.callback_query_handler(lambda c: c.data == "back_to_categories", state="*")
 async def back_to_categories(callback_query: types.CallbackQuery, state: FSMContext):
     keyboard = await get_categories_keyboard()
-    try:
-        await callback_query.message.edit_text("Выберите категорию:", reply_markup=keyboard)
-    except Exception as e:
-        logging.error(f"Ошибка редактирования сообщения: {e}")
-        # Если сообщение нельзя отредактировать, отправляем новое
-        await bot.send_message(
-            callback_query.from_user.id,
-            "Выберите категорию:",
-            reply_markup=keyboard
-        )
+    await safe_edit(callback_query, "Выберите категорию:", reply_markup=keyboard)
     await OrderStates.choosing_category.set()
     await callback_query.answer()
 
@@ -317,44 +450,15 @@ async def add_item_to_cart(callback_query: types.CallbackQuery, state: FSMContex
     # Получаем информацию о товаре
     item = await get_menu_item(int(item_id))
 
-    keyboard = InlineKeyboardMarkup()
-    keyboard.add(InlineKeyboardButton("🛒 Перейти в корзину", callback_data="show_cart"))
-    keyboard.add(InlineKeyboardButton("🍽 Продолжить покупки", callback_data="continue_shopping"))
+    keyboard = _ITEM_ADDED_KEYBOARD
 
     success_message = f"✅ {item.name} добавлен в корзину!\n\nЧто делаем дальше?"
 
     # Если у товара есть фото, показываем его
     if item.photo_file_id:
-        try:
-            await callback_query.message.delete()
-            await bot.send_photo(
-                callback_query.from_user.id,
-                item.photo_file_id,
-                caption=success_message,
-                reply_markup=keyboard
-            )
-        except Exception as e:
-            # Если фото не загружается или сообщение уже удалено, отправляем новое сообщение
-            logging.error(f"Ошибка отправки фото: {e}")
-            try:
-                await bot.send_message(
-                    callback_query.from_user.id,
-                    success_message,
-                    reply_markup=keyboard
-                )
-            except Exception as e2:
-                logging.error(f"Ошибка отправки сообщения: {e2}")
+        await show_photo(callback_query, item.photo_file_id, success_message, reply_markup=keyboard)
     else:
-        try:
-            await callback_query.message.edit_text(success_message, reply_markup=keyboard)
-        except Exception as e:
-            logging.error(f"Ошибка редактирования сообщения: {e}")
-            # Если сообщение нельзя отредактировать, отправляем новое
-            await bot.send_message(
-                callback_query.from_user.id,
-                success_message,
-                reply_markup=keyboard
-            )
+        await safe_edit(callback_query, success_message, reply_markup=keyboard)
 
     await callback_query.answer()
 
@@ -362,16 +466,7 @@ async def add_item_to_cart(callback_query: types.CallbackQuery, state: FSMContex
 @dp.callback_query_handler(lambda c: c.data == "continue_shopping", state="*")
 async def continue_shopping(callback_query: types.CallbackQuery, state: FSMContext):
     keyboard = await get_categories_keyboard()
-    try:
-        await callback_query.message.edit_text("Выберите категорию:", reply_markup=keyboard)
-    except Exception as e:
-        logging.error(f"Ошибка редактирования сообщения: {e}")
-        # Если сообщение нельзя отредактировать, отправляем новое
-        await bot.send_message(
-            callback_query.from_user.id,
-            "Выберите категорию:",
-            reply_markup=keyboard
-        )
+    await safe_edit(callback_query, "Выберите категорию:", reply_markup=keyboard)
     await OrderStates.choosing_category.set()
     await callback_query.answer()
 
@@ -384,16 +479,7 @@ async def show_cart_callback(callback_query: types.CallbackQuery, state: FSMCont
     cart_message = await format_cart_message(cart)
     keyboard = get_cart_keyboard()
 
-    try:
-        await callback_query.message.edit_text(cart_message, reply_markup=keyboard)
-    except Exception as e:
-        logging.error(f"Ошибка редактирования сообщения: {e}")
-        # Если сообщение нельзя отредактировать, отправляем новое
-        await bot.send_message(
-            callback_query.from_user.id,
-            cart_message,
-            reply_markup=keyboard
-        )
+    await safe_edit(callback_query, cart_message, reply_markup=keyboard)
     await callback_query.answer()
 
 
@@ -411,19 +497,7 @@ async def show_cart(message: types.Message, state: FSMContext):
 @dp.callback_query_handler(lambda c: c.data == "clear_cart", state="*")
 async def clear_cart(callback_query: types.CallbackQuery, state: FSMContext):
     await state.update_data(cart={})
-    keyboard = InlineKeyboardMarkup()
-    keyboard.add(InlineKeyboardButton("🍽 Перейти к меню", callback_data="continue_shopping"))
-    
-    try:
-        await callback_query.message.edit_text("🛒 Корзина очищена", reply_markup=keyboard)
-    except Exception as e:
-        logging.error(f"Ошибка редактирования сообщения: {e}")
-        # Если сообщение нельзя отредактировать, отправляем новое
-        await bot.send_message(
-            callback_query.from_user.id,
-            "🛒 Корзина очищена",
-            reply_markup=keyboard
-        )
+    await safe_edit(callback_query, "🛒 Корзина очищена", reply_markup=_CART_CLEARED_KEYBOARD)
     await callback_query.answer()
 
 
@@ -433,22 +507,14 @@ async def checkout(callback_query: types.CallbackQuery, state: FSMContext):
     cart = data.get('cart', {})
 
     if not cart:
-        try:
-            await callback_query.message.edit_text("🛒 Ваша корзина пуста!")
-        except Exception as e:
-            logging.error(f"Ошибка редактирования сообщения: {e}")
-            await bot.send_message(callback_query.from_user.id, "🛒 Ваша корзина пуста!")
+        await safe_edit(callback_query, "🛒 Ваша корзина пуста!")
         await callback_query.answer()
         return
 
     message_text = ("🕐 Введите время, к которому нужно приготовить заказ\n"
                    "Формат: ЧЧ:ММ (например, 13:30)")
     
-    try:
-        await callback_query.message.edit_text(message_text)
-    except Exception as e:
-        logging.error(f"Ошибка редактирования сообщения: {e}")
-        await bot.send_message(callback_query.from_user.id, message_text)
+    await safe_edit(callback_query, message_text)
     
     await OrderStates.choosing_time.set()
     await callback_query.answer()
@@ -456,70 +522,69 @@ async def checkout(callback_query: types.CallbackQuery, state: FSMContext):
 
 @dp.message_handler(state=OrderStates.choosing_time)
 async def process_time_selection(message: types.Message, state: FSMContext):
-    try:
-        time_str = message.text.strip()
-        hour, minute = map(int, time_str.split(':'))
-
-        if not (0 <= hour <= 23 and 0 <= minute <= 59):
-            raise ValueError("Неверный формат времени")
-
-        # Создаем время на сегодня
-        pickup_time = datetime.now().replace(hour=hour, minute=minute, second=0, microsecond=0)
+    match = _TIME_RE.match(message.text.strip())
+    if not match:
+        await message.answer("❌ Неверный формат времени. Пожалуйста, введите время в формате ЧЧ:ММ (например, 13:30)")
+        return
 
-        # Если время уже прошло, переносим на завтра
-        if pickup_time <= datetime.now():
-            pickup_time += timedelta(days=1)
+    hour, minute = int(match.group(1)), int(match.group(2))
 
-        await state.update_data(pickup_time=pickup_time)
+    # Создаем время на сегодня; текущее время берем один раз, чтобы на границе минуты
+    # сравнение не перенесло заказ на лишние сутки
+    now = datetime.now()
+    pickup_time = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
 
-        # Показываем подтверждение
-        data = await state.get_data()
-        cart = data.get('cart', {})
-        cart_message = await format_cart_message(cart)
+    # Если время уже прошло, переносим на завтра
+    if pickup_time <= now:
+        pickup_time += timedelta(days=1)
 
-        confirmation_message = f"{cart_message}\n\n🕐 Время получения: {pickup_time.strftime('%H:%M')}\n\n❓ Подтвердить заказ?"
+    # Redis-хранилище сериализует данные в JSON, поэтому время храним строкой
+    await state.update_data(pickup_time=pickup_time.isoformat())
 
-        keyboard = InlineKeyboardMarkup()
-        keyboard.add(InlineKeyboardButton("✅ Подтвердить", callback_data="confirm_order"))
-        keyboard.add(InlineKeyboardButton("❌ Отменить", callback_data="cancel_order"))
+    # Показываем подтверждение
+    data = await state.get_data()
+    cart = data.get('cart', {})
+    cart_message = await format_cart_message(cart)
 
-        await message.answer(confirmation_message, reply_markup=keyboard)
-        await OrderStates.confirmation.set()
+    confirmation_message = f"{cart_message}\n\n🕐 Время получения: {pickup_time.strftime('%H:%M')}\n\n❓ Подтвердить заказ?"
 
-    except (ValueError, IndexError):
-        await message.answer("❌ Неверный формат времени. Пожалуйста, введите время в формате ЧЧ:ММ (например, 13:30)")
+    await message.answer(confirmation_message, reply_markup=_CONFIRM_ORDER_KEYBOARD)
+    await OrderStates.confirmation.set()
 
 
 @dp.callback_query_handler(lambda c: c.data == "confirm_order", state=OrderStates.confirmation)
 async def confirm_order(callback_query: types.CallbackQuery, state: FSMContext):
     data = await state.get_data()
     cart = data.get('cart', {})
-    pickup_time = data.get('pickup_time')
+
+    # Корзину могли очистить уже после показа подтверждения
+    if not cart:
+        await safe_edit(callback_query, "🛒 Ваша корзина пуста!")
+        await callback_query.answer()
+        return
+
+    pickup_time = datetime.fromisoformat(data['pickup_time'])
 
     # Получаем пользователя
-    user = await get_or_create_user(
-        telegram_id=callback_query.from_user.id,
-        username=callback_query.from_user.username
-    )
+    user_id = await get_db_user_id(state, callback_query.from_user)
 
     # Сохраняем заказ
-    order = await save_order(user.id, cart, pickup_time)
+    order = await save_order(user_id, cart, pickup_time)
 
-    # Уведомляем администратора
-    await notify_admin_about_order(order.id)
+    # Уведомляем администратора в фоне, чтобы не задерживать ответ пользователю
+    task = asyncio.create_task(notify_admin_about_order(order.id), name=f"notify_admin_about_order({order.id})")
+    _background_tasks.add(task)
+    task.add_done_callback(_on_background_task_done)
 
-    # Очищаем состояние
+    # Очищаем состояние, сохраняя id пользователя для следующих заказов
     await state.finish()
+    await state.update_data(db_user_id=user_id)
 
     success_message = (f"✅ Заказ №{order.id} успешно оформлен!\n\n"
                       f"🕐 Время получения: {pickup_time.strftime('%H:%M')}\n"
                       f"📍 Заказ будет готов в указанное время.")
     
-    try:
-        await callback_query.message.edit_text(success_message)
-    except Exception as e:
-        logging.error(f"Ошибка редактирования сообщения: {e}")
-        await bot.send_message(callback_query.from_user.id, success_message)
+    await safe_edit(callback_query, success_message)
     
     await callback_query.answer()
 
@@ -528,36 +593,33 @@ async def confirm_order(callback_query: types.CallbackQuery, state: FSMContext):
 async def cancel_order(callback_query: types.CallbackQuery, state: FSMContext):
     await state.finish()
     
-    keyboard = InlineKeyboardMarkup()
-    keyboard.add(InlineKeyboardButton("🍽 Вернуться к меню", callback_data="continue_shopping"))
-    
-    try:
-        await callback_query.message.edit_text("❌ Заказ отменен", reply_markup=keyboard)
-    except Exception as e:
-        logging.error(f"Ошибка редактирования сообщения: {e}")
-        await bot.send_message(
-            callback_query.from_user.id,
-            "❌ Заказ отменен",
-            reply_markup=keyboard
-        )
+    await safe_edit(callback_query, "❌ Заказ отменен", reply_markup=_ORDER_CANCELLED_KEYBOARD)
     
     await callback_query.answer()
 
 
 @dp.message_handler(lambda message: message.text == "👤 Мои заказы")
-async def show_my_orders(message: types.Message):
-    user = await get_or_create_user(
-        telegram_id=message.from_user.id,
-        username=message.from_user.username
-    )
+async def show_my_orders(message: types.Message, state: FSMContext):
+    user_id = await get_db_user_id(state, message.from_user)
 
+    # Сумма каждого заказа считается в БД, позиции заказов не загружаются
     async with AsyncSessionLocal() as session:
         result = await session.execute(
-            select(Order).options(
-                selectinload(Order.order_items).selectinload(OrderItem.menu_item)
-            ).where(Order.user_id == user.id).order_by(Order.created_at.desc()).limit(5)
+            select(
+                Order.id,
+                Order.status,
+                Order.pickup_time,
+                Order.created_at,
+                func.coalesce(func.sum(MenuItem.price * OrderItem.quantity), 0).label("total")
+            )
+            .outerjoin(OrderItem, OrderItem.order_id == Order.id)
+            .outerjoin(MenuItem, MenuItem.id == OrderItem.menu_item_id)
+            .where(Order.user_id == user_id)
+            .group_by(Order.id)
+            .order_by(Order.created_at.desc())
+            .limit(5)
         )
-        orders = result.scalars().all()
+        orders = result.all()
 
     if not orders:
         await message.answer("📝 У вас пока нет заказов")
@@ -569,9 +631,7 @@ async def show_my_orders(message: types.Message):
         orders_text += f"{status_emoji} Заказ №{order.id}\n"
         orders_text += f"🕐 Время получения: {order.pickup_time.strftime('%H:%M')}\n"
         orders_text += f"📅 Создан: {order.created_at.strftime('%d.%m.%Y %H:%M')}\n"
-
-        total_price = sum(item.menu_item.price * item.quantity for item in order.order_items)
-        orders_text += f"💰 Сумма: {total_price}₸\n\n"
+        orders_text += f"💰 Сумма: {int(order.total)}₸\n\n"
 
     await message.answer(orders_text)
 
@@ -581,13 +641,38 @@ async def show_my_orders(message: types.Message):
 # async def set_order_ready(callback_query: types.CallbackQuery):
 
 
-async def main():
-    # Создаем таблицы при запуске
-    await create_tables()
+async def on_startup(dispatcher: Dispatcher):
+    # Схема создается migrate_db.py; при запуске таблицы создаются только по флагу INIT_DB
+    if INIT_DB:
+        await create_tables()
+
+    if WEBHOOK_URL:
+        await bot.set_webhook(WEBHOOK_URL)
 
-    # Запускаем бота
-    await dp.start_polling()
+
+async def on_shutdown(dispatcher: Dispatcher):
+    # Дожидаемся уведомлений о заказах, подтвержденных перед остановкой
+    if _background_tasks:
+        await asyncio.gather(*_background_tasks, return_exceptions=True)
+
+    # Хранилище состояний и сессию основного бота закрывает executor
+    if admin_notification_bot.session:
+        await admin_notification_bot.session.close()
 
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    if uvloop is not None:
+        uvloop.install()
+
+    if WEBHOOK_URL:
+        # Telegram сам присылает обновления, без циклов getUpdates
+        executor.start_webhook(
+            dispatcher=dp,
+            webhook_path=WEBHOOK_PATH,
+            on_startup=on_startup,
+            on_shutdown=on_shutdown,
+            host=WEBAPP_HOST,
+            port=WEBAPP_PORT,
+        )
+    else:
+        executor.start_polling(dp, on_startup=on_startup, on_shutdown=on_shutdown)
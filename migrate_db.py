@@ -1,36 +1,64 @@
 import asyncio
-from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy import text
 from models import Base
-from config import DATABASE_URL
+from db import engine
+
+# Ключ advisory-блокировки миграций
+MIGRATION_LOCK_KEY = 20240101
 
 
 async def migrate_database():
     """Обновляет структуру базы данных без потери данных"""
-    engine = create_async_engine(DATABASE_URL, echo=True)
-
     async with engine.begin() as conn:
-        # Проверяем, существует ли колонка photo_file_id
-        result = await conn.execute(text("""
-            SELECT column_name 
-            FROM information_schema.columns 
-            WHERE table_name='menu_items' AND column_name='photo_file_id';
-        """))
+        # Блокировка до конца транзакции, чтобы одновременные деплои не выполняли миграцию параллельно
+        await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
 
-        column_exists = result.fetchone()
+        # Создаем недостающие таблицы (в новых таблицах уже есть все колонки)
+        await conn.run_sync(Base.metadata.create_all)
 
-        if not column_exists:
-            # Добавляем новую колонку для фотографий
-            await conn.execute(text("""
-                ALTER TABLE menu_items 
-                ADD COLUMN photo_file_id VARCHAR;
-            """))
-            print("✅ Добавлена колонка photo_file_id в таблицу menu_items")
-        else:
-            print("ℹ️ Колонка photo_file_id уже существует")
+        # Колонка для фотографий в таблицах, созданных до ее появления
+        await conn.execute(text("""
+            ALTER TABLE menu_items
+            ADD COLUMN IF NOT EXISTS photo_file_id VARCHAR;
+        """))
+        print("✅ Колонка photo_file_id есть в таблице menu_items")
 
-        # Создаем все остальные таблицы, если их нет
-        await conn.run_sync(Base.metadata.create_all)
+        # Цены храним в точном десятичном типе вместо double precision. ALTER TYPE
+        # переписывает таблицу под ACCESS EXCLUSIVE, поэтому выполняется только один раз
+        await conn.execute(text("""
+            DO $$
+            BEGIN
+                IF EXISTS (
+                    SELECT 1 FROM information_schema.columns
+                    WHERE table_name = 'menu_items' AND column_name = 'price'
+                      AND (data_type <> 'numeric' OR numeric_precision IS DISTINCT FROM 10
+                           OR numeric_scale IS DISTINCT FROM 2)
+                ) THEN
+                    ALTER TABLE menu_items
+                    ALTER COLUMN price TYPE numeric(10,2) USING price::numeric(10,2);
+                END IF;
+            END $$;
+        """))
+        print("✅ Колонка price имеет тип numeric(10,2)")
+
+        # Индексы для существующих таблиц (create_all не добавляет их в уже созданные таблицы)
+        await conn.execute(text("""
+            CREATE INDEX IF NOT EXISTS ix_menu_items_category_available
+            ON menu_items (category, is_available);
+        """))
+        await conn.execute(text("""
+            CREATE INDEX IF NOT EXISTS ix_orders_user_created
+            ON orders (user_id, created_at);
+        """))
+        await conn.execute(text("""
+            CREATE INDEX IF NOT EXISTS ix_orders_created_at
+            ON orders (created_at);
+        """))
+        await conn.execute(text("""
+            CREATE INDEX IF NOT EXISTS ix_order_items_order_id
+            ON order_items (order_id);
+        """))
+        print("✅ Индексы созданы")
         print("✅ Структура базы данных обновлена")
 
 
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, BigInteger
+from sqlalchemy import Column, Integer, String, Numeric, Boolean, DateTime, ForeignKey, BigInteger, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -19,11 +19,15 @@ class User(Base):
 
 class MenuItem(Base):
     __tablename__ = 'menu_items'
+    __table_args__ = (
+        # Выбор категорий и позиций категории идут по category + is_available
+        Index("ix_menu_items_category_available", "category", "is_available"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     category = Column(String, nullable=False)
     name = Column(String, nullable=False)
-    price = Column(Float, nullable=False)
+    price = Column(Numeric(10, 2), nullable=False)
     is_available = Column(Boolean, default=True)
     photo_file_id = Column(String, nullable=True)  # Для хранения ID фотографии в Telegram
 
@@ -33,6 +37,12 @@ class MenuItem(Base):
 
 class Order(Base):
     __tablename__ = 'orders'
+    __table_args__ = (
+        # "Мои заказы": последние заказы пользователя по дате создания
+        Index("ix_orders_user_created", "user_id", "created_at"),
+        # "Все заказы" в админ-боте: последние заказы всех пользователей по дате создания
+        Index("ix_orders_created_at", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
@@ -47,6 +57,9 @@ class Order(Base):
 
 class OrderItem(Base):
     __tablename__ = 'order_items'
+    __table_args__ = (
+        Index("ix_order_items_order_id", "order_id"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     order_id = Column(Integer, ForeignKey('orders.id'), nullable=False)
@@ -0,0 +1,99 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict
+
+from aiogram.utils.exceptions import RetryAfter
+
+# Лимиты Telegram: не более 30 сообщений в секунду на бота и около 1 сообщения в секунду в один чат.
+# Ограничение на чат мягкое: короткие серии (например, список заказов админу) уходят сразу,
+# а если Telegram все же ответит RetryAfter, отправка повторяется после паузы
+GLOBAL_RATE = 30
+PER_CHAT_INTERVAL = 1.0
+PER_CHAT_BURST = 20
+
+
+class TokenBucket:
+    """Ограничивает частоту операций: rate токенов в секунду, не больше capacity в запасе"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class _ChatState:
+    """Состояние отправки в один чат"""
+
+    __slots__ = ("lock", "bucket", "users", "last_send_at")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()  # Сообщения в один чат уходят по очереди и не перемешиваются
+        self.bucket = TokenBucket(1 / PER_CHAT_INTERVAL, PER_CHAT_BURST)
+        self.users = 0  # Сколько отправок сейчас удерживают или ждут lock
+        self.last_send_at = float("-inf")
+
+
+_global_bucket = TokenBucket(GLOBAL_RATE, GLOBAL_RATE)
+_chats: Dict[int, _ChatState] = {}
+_last_eviction_at = time.monotonic()
+
+# Как часто удалять состояние чатов, в которые давно ничего не отправлялось
+CHAT_EVICTION_INTERVAL = 60.0
+
+
+def _evict_idle_chats(now: float):
+    # Чат можно забыть, только если в него никто не отправляет и его лимит уже полностью восстановился
+    idle = [
+        chat_id for chat_id, chat in _chats.items()
+        if chat.users == 0 and now - chat.last_send_at > PER_CHAT_BURST * PER_CHAT_INTERVAL
+    ]
+    for chat_id in idle:
+        del _chats[chat_id]
+
+
+async def safe_send(chat_id: int, send: Callable[[], Awaitable]):
+    """Отправляет сообщение с учетом лимитов Telegram.
+
+    send - функция без аргументов, создающая запрос к API (например, functools.partial
+    от bot.send_message). При RetryAfter запрос повторяется после указанной паузы.
+    """
+    global _last_eviction_at
+    now = time.monotonic()
+    if now - _last_eviction_at > CHAT_EVICTION_INTERVAL:
+        _evict_idle_chats(now)
+        _last_eviction_at = now
+
+    chat = _chats.get(chat_id)
+    if chat is None:
+        chat = _chats[chat_id] = _ChatState()
+
+    chat.users += 1
+    try:
+        async with chat.lock:
+            await chat.bucket.acquire()
+
+            while True:
+                await _global_bucket.acquire()
+                try:
+                    return await send()
+                except RetryAfter as e:
+                    logging.warning(f"Превышен лимит Telegram для чата {chat_id}, повтор через {e.timeout} с")
+                    await asyncio.sleep(e.timeout)
+                finally:
+                    chat.last_send_at = time.monotonic()
+    finally:
+        chat.users -= 1